@@ -1,5 +1,5 @@
 import pandas as pd
-from src.metrics import Builder
+from src.metrics import Builder, batch
 from pathlib import Path
 from Bio.PDB import PDBParser
 
@@ -16,10 +16,6 @@ def read_data(fname):
     return s
 
 if __name__ == '__main__':
-    results = []
-    for pdbfile in dataset.iterdir():
-        s = read_data(pdbfile)
-        s.measure()
-        results.append(s.serializer())
+    results = list(batch.run(dataset.iterdir()))
     proteindata = pd.DataFrame(results)
     #print(proteindata)
\ No newline at end of file
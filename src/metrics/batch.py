@@ -0,0 +1,47 @@
+"""
+Measure many structures in parallel, one file per worker process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from Bio.PDB import PDBParser
+
+from .metrics import Builder
+
+
+def _measure_one(path):
+    '''
+    Parse and measure one PDB file.
+
+    :param path: File path to PDB file.
+    :type path: Path
+    :return: Measurements, see ModStructure.serializer
+    :rtype: dict
+
+    '''
+    path = Path(path)
+    parser = PDBParser(QUIET=1, structure_builder=Builder())
+    structure = parser.get_structure(path.stem, path)
+    # chains are computed serially, the files are already spread over all CPUs
+    structure.measure(workers=1)
+    return structure.serializer()
+
+
+def run(paths, workers=None, chunksize=8):
+    '''
+    Measure PDB files in a pool of worker processes. Results are yielded in
+    the order of paths.
+
+    :param paths: File paths to PDB files.
+    :type paths: iterable of Path
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :type workers: int
+    :param chunksize: number of files sent to a worker at once
+    :type chunksize: int
+    :return: Measurements, see ModStructure.serializer
+    :rtype: generator of dict
+
+    '''
+    with ProcessPoolExecutor(workers or os.cpu_count()) as executor:
+        yield from executor.map(_measure_one, paths, chunksize=chunksize)
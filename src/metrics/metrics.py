@@ -1,13 +1,24 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from pathlib import Path
+from types import MappingProxyType
+
 import numpy as np
 from Bio.PDB import PDBParser
-from Bio.PDB.Polypeptide import is_aa
-from Bio.PDB.SASA import ShrakeRupley
 from Bio.PDB.Structure import Structure
 from Bio.PDB.StructureBuilder import StructureBuilder
-from Bio.SeqUtils.ProtParam import ProteinAnalysis
+from Bio.Data.IUPACData import protein_weights
 from Bio.PDB.Residue import Residue
 from Bio.PDB.Polypeptide import three_to_one, standard_aa_names
 
+from .sasa import atomic_radii, shrake_rupley
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+THREE_TO_ONE = MappingProxyType(
+    {name: three_to_one(name) for name in standard_aa_names})
+
 GLYXGLY_ASA = {  # from Miller, Janin et al (1987)
     "A": 113,
     "R": 241,
@@ -54,6 +65,45 @@ hydrophobicityscale = {  # from Guy, H.R., Biophys J. 47:61-70(1985)
     'V': -1.270,
 }
 
+WATER_WEIGHT = 18.0153  # average mass, as used by Bio.SeqUtils
+
+
+def letter_table(values):
+    """
+    Return a length-128 array holding each value at the ASCII code of its
+    one-letter key, so that it can be indexed with ord(letter) or with a
+    whole sequence as np.frombuffer(sequence.encode(), dtype=np.uint8).
+
+    :param values: mapping of one-letter amino acid codes to values
+    :type values: dict
+    :return: Lookup table, zero for letters not in values
+    :rtype: numpy.ndarray
+
+    """
+    table = np.zeros(128, dtype=np.float64)
+    for letter, value in values.items():
+        table[ord(letter)] = value
+    return table
+
+
+def letter_codes(sequence):
+    """
+    Return the ASCII codes of a one-letter sequence, to index letter tables.
+
+    :param sequence: amino acid sequence in one letter code
+    :type sequence: str
+    :rtype: numpy.ndarray
+
+    """
+    return np.frombuffer(sequence.encode("ascii"), dtype=np.uint8)
+
+
+GLYXGLY_ASA_128 = letter_table(GLYXGLY_ASA)
+HYDRO_128 = letter_table(hydrophobicityscale)
+MW_128 = letter_table({  # average residue weights, i.e. minus one water
+    letter: protein_weights[letter] - WATER_WEIGHT for letter in AMINO_ACIDS
+})
+
 
 class ModStructure(Structure):
     """
@@ -62,23 +112,80 @@ class ModStructure(Structure):
     coordinates.
     """
 
+    # measurement values cached on first access, dropped by measure
+    _cached = (
+        'sequence', 'length', 'sasa', '_aminocount', '_com_global',
+        '_resletter_idx', '_com', '_sasa', '_mono_sasa',
+    )
+
     def __init__(self, id):
         Structure.__init__(self, id)
 
-    def measure(self):
+    @classmethod
+    def build_from_gemmi(cls, path, structure_id=None):
+        '''
+        Read a PDB or mmCIF file with gemmi's C++ parser and build the
+        ModStructure/ModRes hierarchy from it, as the Builder does for
+        Bio.PDB.PDBParser. Requires the optional gemmi package.
+
+        :param path: path to the coordinate file
+        :type path: str or Path
+        :param structure_id: structure id, defaults to the file stem
+        :type structure_id: str
+        :return: Structure entity
+        :rtype: ModStructure
+
+        '''
+        import gemmi
+
+        path = Path(path)
+        builder = Builder()
+        builder.init_structure(structure_id or path.stem)
+        for model_id, model in enumerate(gemmi.read_structure(str(path))):
+            builder.init_model(model_id, model_id + 1)
+            for chain in model:
+                builder.init_chain(chain.name)
+                for residue in chain:
+                    if residue.name not in THREE_TO_ONE:
+                        continue
+                    builder.init_seg(residue.segment.ljust(4))
+                    field = "H" if residue.het_flag == "H" else " "
+                    builder.init_residue(
+                        residue.name, field, residue.seqid.num,
+                        residue.seqid.icode)
+                    for atom in residue:
+                        altloc = atom.altloc if atom.has_altloc() else " "
+                        fullname = (atom.name if len(atom.name) == 4
+                                    else f" {atom.name:<3}")
+                        builder.init_atom(
+                            atom.name,
+                            np.array(atom.pos.tolist(), dtype=np.float32),
+                            atom.b_iso,
+                            atom.occ,
+                            altloc,
+                            fullname,
+                            atom.serial,
+                            atom.element.name.upper(),
+                        )
+        return builder.get_structure()
+
+    def measure(self, workers=None):
         '''
         Assigns measurement to an attribute.
         
         :param self: Structure entity
+        :param workers: maximum number of processes for the SASA calculation,
+            see calculate_sasa.
+        :type workers: int
 
         '''
-        self.sequence = self.sequencer()
-        self.length = self.getlength()
+        self.clear_cache()
+        self.sasa = self.calculate_sasa(workers)
         self.MWkDa = self.molecularweight() / 1000
-        self.fPos = self.aminocount()[0] / self.length
-        self.fNeg = self.aminocount()[1] / self.length
-        self.fFatty = self.aminocount()[2] / self.length
-        self.sasa = self.calculate_sasa()
+        pos, neg, hyd = self.aminocount()
+        self.fPos = pos / self.length
+        self.fNeg = neg / self.length
+        self.fFatty = hyd / self.length
         self.nc = self.netcharge()
         self.ncd = self.netchargedensity()
         self.dpm = self.dipolemoment()
@@ -111,6 +218,38 @@ class ModStructure(Structure):
         }
         return measurements
 
+    def clear_cache(self):
+        '''
+        Drop the cached measurement values, so that they are recomputed from
+        the current residues on next access.
+
+        :param self: Structure entity
+
+        '''
+        for name in self._cached:
+            self.__dict__.pop(name, None)
+
+    @cached_property
+    def sequence(self):
+        '''
+        Amino acid sequence in one letter code, see sequencer.
+        '''
+        return self.sequencer()
+
+    @cached_property
+    def length(self):
+        '''
+        Length of the protein sequence, see getlength.
+        '''
+        return self.getlength()
+
+    @cached_property
+    def sasa(self):
+        '''
+        Solvent accessible surface area, see calculate_sasa.
+        '''
+        return self.calculate_sasa()
+
     def sequencer(self):
         '''
         Return polypeptide sequence from peptides.
@@ -120,10 +259,7 @@ class ModStructure(Structure):
         :rtype: str
 
         '''
-        sequence = ""
-        for residue in self.get_residues():
-            sequence += residue.resletter
-        return sequence
+        return "".join(residue.resletter for residue in self.get_residues())
 
     def getlength(self):
         '''
@@ -138,48 +274,161 @@ class ModStructure(Structure):
 
     def molecularweight(self):
         '''
-        Return molecular weight of the protein sequence.
+        Return molecular weight of the protein sequence, from the average
+        residue weights plus one water for the chain termini.
 
         :param self: Structure entity
         :return: Molecular weight
         :rtype: int
 
         '''
-        return ProteinAnalysis(str(self.sequence)).molecular_weight()
+        return MW_128[letter_codes(self.sequence)].sum() + WATER_WEIGHT
 
     def aminocount(self):
         '''
         Return the amount of positive, negative and hydrophobic residues.
+        The sequence is scanned once and the counts are cached on the
+        structure until the next call to measure.
 
         :param self: Structure entity
         :return: Amount of positive, negative and hydrophobic residues in protein.
         :rtype: tuple
 
         '''
-        aminopos = self.sequence.count('K') + self.sequence.count('R')
-        aminoneg = self.sequence.count('D') + self.sequence.count('E')
-        aminohyd = sum(self.sequence.count(value) for value in 'FLIV')
-
+        return self._aminocount
+
+    @cached_property
+    def _aminocount(self):
+        counts = Counter(self.sequence)
+        aminopos = counts['K'] + counts['R']
+        aminoneg = counts['D'] + counts['E']
+        aminohyd = sum(counts[value] for value in 'FLIV')
         return aminopos, aminoneg, aminohyd
 
-    def calculate_sasa(self):
+    def calculate_sasa(self, workers=None):
         """
-        Perform SASA calculation with ShrakeRupley algorithm for the individual
-        chains (monomers). Attach results to residue objects as Residue.monosasa.
+        Perform SASA calculation with the Shrake-Rupley algorithm for the
+        individual chains (monomers). Attach results to atom and residue
+        objects as Atom.sasa, Residue.sasa and Residue.monosasa. Chains are
+        independent and are computed in parallel processes when there is
+        more than one.
 
         :param self: Structure entity
+        :param workers: maximum number of worker processes, defaults to the
+            number of CPUs. Use 1 to compute the chains serially.
+        :type workers: int
         :return: Solvent accessible surface area (SASA)
         :rtype: int
 
         """
-        calculator = ShrakeRupley()
-        for chain in self.get_chains():
-            calculator.compute(chain, level="R")  # calculate on the monomers
+        chains = list(self.get_chains())  # calculate on the monomers
+        chain_atoms = [list(chain.get_atoms()) for chain in chains]
+        chain_coords = [
+            np.array([atom.coord for atom in atoms], dtype=np.float64)
+            for atoms in chain_atoms
+        ]
+        chain_radii = [atomic_radii(atoms) for atoms in chain_atoms]
+
+        if len(chains) > 1 and workers != 1:
+            with ProcessPoolExecutor(
+                    max_workers=workers or os.cpu_count()) as executor:
+                chain_sasa = list(
+                    executor.map(shrake_rupley, chain_coords, chain_radii))
+        else:
+            chain_sasa = list(map(shrake_rupley, chain_coords, chain_radii))
+
+        for chain, atoms, atom_sasa in zip(chains, chain_atoms, chain_sasa):
+            for atom, sasa in zip(atoms, atom_sasa):
+                atom.sasa = sasa
+
+            start = 0
             for residue in chain.get_residues():
-                residue.monosasa = residue.sasa.copy()
+                stop = start + len(residue)
+                residue.sasa = atom_sasa[start:stop].sum()
+                residue.monosasa = float(residue.sasa)
+                start = stop
 
         return sum(residue.monosasa for residue in self.get_residues())
 
+    @cached_property
+    def _resletter_idx(self):
+        '''
+        Letter codes of the sequence, to index the letter tables.
+        '''
+        return letter_codes(self.sequence)
+
+    @cached_property
+    def _com(self):
+        '''
+        Residue centers of mass, reduced from the atom arrays in one pass.
+        '''
+        starts = self._residue_starts
+        weighted = self._coords * self._masses[:, None]
+        return (np.add.reduceat(weighted, starts, axis=0)
+                / np.add.reduceat(self._masses, starts)[:, None])
+
+    @cached_property
+    def _sasa(self):
+        '''
+        Residue SASA values, running calculate_sasa if needed.
+        '''
+        self.sasa  # runs calculate_sasa on first access
+        return np.fromiter(
+            (residue.sasa for residue in self.get_residues()),
+            dtype=np.float64)
+
+    @cached_property
+    def _mono_sasa(self):
+        '''
+        Residue monomer SASA values, running calculate_sasa if needed.
+        '''
+        self.sasa  # runs calculate_sasa on first access
+        return np.fromiter(
+            (residue.monosasa for residue in self.get_residues()),
+            dtype=np.float64)
+
+    @cached_property
+    def _com_global(self):
+        '''
+        Center of mass of the structure, see center_of_mass_fast.
+        '''
+        return self.center_of_mass_fast()
+
+    def build_atom_arrays(self):
+        '''
+        Stack the coordinates and masses of all atoms into contiguous float64
+        arrays, together with the index of the residue each atom belongs to
+        and the index of the first atom of every residue. Called by
+        Builder.get_structure once parsing is done.
+
+        :param self: Structure entity
+
+        '''
+        coords, masses, residue_ids, residue_starts = [], [], [], []
+        for i, residue in enumerate(self.get_residues()):
+            residue_starts.append(len(coords))
+            for atom in residue.get_atoms():
+                coords.append(atom.coord)
+                masses.append(atom.mass)
+                residue_ids.append(i)
+        self._coords = np.array(coords, dtype=np.float64).reshape(-1, 3)
+        self._masses = np.array(masses, dtype=np.float64)
+        self._residue_id = np.array(residue_ids, dtype=np.intp)
+        self._residue_starts = np.array(residue_starts, dtype=np.intp)
+
+    def center_of_mass_fast(self):
+        '''
+        Return the center of mass of the structure from the atom arrays set
+        up by build_atom_arrays.
+
+        :param self: Structure entity
+        :return: Center of mass
+        :rtype: numpy.ndarray
+
+        '''
+        masses = self._masses
+        return (self._coords * masses[:, None]).sum(axis=0) / masses.sum()
+
     def netcharge(self):
         '''
         Return the net charge of the protein from the amount of positive and negative amino acids.
@@ -189,7 +438,8 @@ class ModStructure(Structure):
         :rtype: int
 
         '''
-        return self.aminocount()[0] - self.aminocount()[1]
+        aminopos, aminoneg, _ = self.aminocount()
+        return aminopos - aminoneg
 
     def netchargedensity(self):
         '''
@@ -208,20 +458,18 @@ class ModStructure(Structure):
         '''
         Return dipole moment calculated from the dipole moments of the positive and negative residues.
         Source for dipolemoment equation: Felder, Prilusky, Silman, Sussman Nucleic Acids Research 2007
+        Uses the cached residue arrays.
 
         :param self: Structure entity
         :return: Dipole vector
         :rtype: tuple
 
         '''
-        dipolpos = sum(
-            residue.center_of_mass()
-            for residue in self.get_residues() if residue.resletter in 'KR'
-        )
-        dipolneg = sum(
-            residue.center_of_mass()
-            for residue in self.get_residues() if residue.resletter in 'DE'
-        )
+        idx = self._resletter_idx
+        pos_mask = np.isin(idx, [ord('K'), ord('R')])
+        neg_mask = np.isin(idx, [ord('D'), ord('E')])
+        dipolpos = self._com[pos_mask].sum(axis=0)
+        dipolneg = self._com[neg_mask].sum(axis=0)
 
         return dipolpos - dipolneg
 
@@ -239,36 +487,30 @@ class ModStructure(Structure):
     def truehydrophobicity(self):
         '''
         Calculate total hydrophobicity for residues that are more than 25%
-        exposed to the surface.
+        exposed to the surface. Uses the cached residue arrays.
 
         :param self: Structure entity
         :return: Hydrophobicity for exposed amino acids
         :rtype: int
 
         '''
-        truehydrophobicity = 0
-        for residue in self.get_residues():
-            # if residue.get_resname() in GLYXGLY_ASA:
-            sasaratio = residue.sasa / GLYXGLY_ASA[residue.resletter]
-            if sasaratio > 0.25:
-                truehydrophobicity += hydrophobicityscale[residue.resletter]
+        idx = self._resletter_idx
+        sasaratio = self._sasa / GLYXGLY_ASA_128[idx]
+        truehydrophobicity = float(HYDRO_128[idx][sasaratio > 0.25].sum())
         return truehydrophobicity
 
     def hydrophobicvector(self):
         '''
-        Calculate first order hydrophobic moment vector.
+        Calculate first order hydrophobic moment vector. Uses the cached
+        residue arrays and center of mass.
 
         :param self: Structure entity
         :return: Hydrophobic vector
         :rtype: tuple
 
         '''
-        hydrophobicvector = 0
-        for residue in self.get_residues():
-            #if residue.get_resname() in GLYXGLY_ASA:
-            hydrophobicvector += (
-                hydrophobicityscale[residue.resletter] * residue.sasa * (
-                      residue.center_of_mass() - self.center_of_mass()))
+        weights = HYDRO_128[self._resletter_idx] * self._sasa
+        hydrophobicvector = weights @ (self._com - self._com_global)
         return hydrophobicvector
         
     def hydrophobicmoment(self):
@@ -283,16 +525,16 @@ class ModStructure(Structure):
         '''
         return np.linalg.norm(self.hydrophobicvector())
 
-    @classmethod
-    def anglemeasurement(cls, v, u):
+    @staticmethod
+    def anglemeasurement(v, u):
         '''
-        Calculate angle between any two vectors v and u, in degrees.
-        
+        Calculate angle between any two vectors v and u, in degrees. Uses
+        atan2 of the cross and dot products, which stays accurate for
+        (anti)parallel vectors where arccos of the cosine does not.
+
         '''
-        return np.degrees(np.arccos(
-            (np.dot(v, u))/
-            (np.linalg.norm(v)*np.linalg.norm(u))
-        ))
+        return np.degrees(np.arctan2(
+            np.linalg.norm(np.cross(v, u)), np.dot(v, u)))
 
     def __str__(self):
         return f"ModStructure instance {self.id}"
@@ -302,10 +544,11 @@ class ModStructure(Structure):
 
 
 class ModRes(Residue):
-    def __init__(self, id, resname, segid):
+    def __init__(self, id, resname, segid, resletter=None):
         Residue.__init__(self, id, resname, segid)
-        self.resletter = three_to_one(
-            resname) if resname in standard_aa_names else ""
+        if resletter is None:
+            resletter = THREE_TO_ONE.get(resname, "")
+        self.resletter = resletter
 
     def is_buried(self, threshold=0.25):
         """
@@ -321,7 +564,8 @@ class ModRes(Residue):
 
         """
         try:
-            return self.monosasa / GLYXGLY_ASA[self.resletter] <= threshold
+            return (self.monosasa / GLYXGLY_ASA_128[ord(self.resletter)]
+                    <= threshold)
         except AttributeError:
             raise AttributeError(
                 "Attrib. monosasa not set: call structure.calculate_sasa first"
@@ -360,7 +604,8 @@ class Builder(StructureBuilder):
         Instantiate residue as src.metrics.metrics.ModRes object. Overrides
         Bio.PDB.StructureBuilder.init_residue.
         """
-        if not is_aa(resname, standard=True):
+        resletter = THREE_TO_ONE.get(resname)
+        if resletter is None:
             return
         if field != " ":
             if field == "H":
@@ -370,16 +615,26 @@ class Builder(StructureBuilder):
         self.residue = ModRes(
             residue_id,
             resname,
-            self.segid)  # ---> bespoke class
+            self.segid,
+            resletter)  # ---> bespoke class
         self.chain.add(self.residue)
 
+    def get_structure(self):
+        """
+        Return the structure with its atom arrays built. Overrides
+        Bio.PDB.StructureBuilder.get_structure.
+        """
+        structure = StructureBuilder.get_structure(self)
+        structure.build_atom_arrays()
+        return structure
+
 
 if __name__ == '__main__':
     parser = PDBParser(QUIET=1, structure_builder=Builder())
     s = parser.get_structure("1ris", "data/data1/1ris.pdb")
     # s.calculate_sasa()
     s.measure()
-    com = s.center_of_mass()
+    com = s._com_global
     dpv = s.dipolevector()
     hpv = s.hydrophobicvector()
     print(s.anglemeasurement(dpv - com, hpv - com))
@@ -0,0 +1,137 @@
+"""
+Solvent accessible surface area (SASA) with the Shrake-Rupley algorithm.
+
+Atoms are bucketed in a KD-tree once, so every atom is only tested against
+the neighbours that can actually overlap its probe sphere, and all overlap
+tests compare squared distances. The sphere-point occlusion test is compiled
+with Numba and runs in parallel over atoms.
+"""
+import numpy as np
+from numba import njit, prange
+from scipy.spatial import cKDTree
+from Bio.PDB.SASA import ATOMIC_RADII
+
+PROBE_RADIUS = 1.40
+N_SPHERE = 100
+
+
+def sphere_points(n=N_SPHERE):
+    '''
+    Return n points evenly spread on the unit sphere (golden spiral), the same
+    point set used by Bio.PDB.SASA.ShrakeRupley.
+
+    :param n: number of points
+    :type n: int
+    :return: Point coordinates
+    :rtype: numpy.ndarray of shape (n, 3)
+
+    '''
+    k = np.arange(n)
+    z = 1 - (2 * k + 1) / n
+    r = np.sqrt(1 - z * z)
+    longitude = k * np.pi * (3 - 5 ** 0.5)
+    return np.column_stack((np.cos(longitude) * r, np.sin(longitude) * r, z))
+
+
+SPHERE_POINTS = sphere_points()
+
+
+def atomic_radii(atoms):
+    '''
+    Return the van der Waals radius of each atom, looked up by element.
+
+    :param atoms: iterable of Bio.PDB.Atom objects
+    :return: Radii in Angstrom
+    :rtype: numpy.ndarray
+
+    '''
+    return np.array(
+        [ATOMIC_RADII.get(atom.element, 2.0) for atom in atoms],
+        dtype=np.float64)
+
+
+def neighbor_lists(coords, radii):
+    '''
+    Return, for every atom, the atoms whose spheres overlap with its own, as
+    compressed sparse row arrays: the neighbours of atom i are
+    indices[indptr[i]:indptr[i + 1]].
+
+    :param coords: atom coordinates, shape (N, 3)
+    :type coords: numpy.ndarray
+    :param radii: sphere radii, shape (N,)
+    :type radii: numpy.ndarray
+    :return: indptr and indices arrays
+    :rtype: tuple
+
+    '''
+    n = len(coords)
+    tree = cKDTree(coords)
+    pairs = tree.query_pairs(r=2 * radii.max(), output_type='ndarray')
+    first, second = pairs[:, 0], pairs[:, 1]
+    offsets = coords[first] - coords[second]
+    reach = radii[first] + radii[second]
+    overlap = (offsets * offsets).sum(axis=1) < reach * reach
+    first, second = first[overlap], second[overlap]
+
+    rows = np.concatenate((first, second))
+    cols = np.concatenate((second, first))
+    indices = cols[np.argsort(rows, kind='stable')].astype(np.int64)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, indices
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _accessible_points(coords, radii, indptr, indices, sphere):
+    '''
+    Count, for every atom, the sphere points not buried by any neighbour.
+    '''
+    n = coords.shape[0]
+    n_points = sphere.shape[0]
+    accessible = np.zeros(n, dtype=np.float64)
+    for i in prange(n):
+        r_i = radii[i]
+        count = 0
+        for p in range(n_points):
+            px = coords[i, 0] + r_i * sphere[p, 0]
+            py = coords[i, 1] + r_i * sphere[p, 1]
+            pz = coords[i, 2] + r_i * sphere[p, 2]
+            buried = False
+            for k in range(indptr[i], indptr[i + 1]):
+                j = indices[k]
+                dx = px - coords[j, 0]
+                dy = py - coords[j, 1]
+                dz = pz - coords[j, 2]
+                if dx * dx + dy * dy + dz * dz <= radii[j] * radii[j]:
+                    buried = True
+                    break
+            if not buried:
+                count += 1
+        accessible[i] = count
+    return accessible
+
+
+def shrake_rupley(coords, radii, probe_radius=PROBE_RADIUS,
+                  sphere=SPHERE_POINTS):
+    '''
+    Return the solvent accessible surface area of each atom.
+
+    :param coords: atom coordinates, shape (N, 3)
+    :type coords: numpy.ndarray
+    :param radii: atom van der Waals radii, shape (N,)
+    :type radii: numpy.ndarray
+    :param probe_radius: radius of the solvent probe
+    :type probe_radius: float
+    :param sphere: unit sphere points to test for occlusion, shape (M, 3)
+    :type sphere: numpy.ndarray
+    :return: SASA per atom
+    :rtype: numpy.ndarray
+
+    '''
+    coords = np.ascontiguousarray(coords, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64) + probe_radius
+    sphere = np.ascontiguousarray(sphere, dtype=np.float64)
+
+    indptr, indices = neighbor_lists(coords, radii)
+    accessible = _accessible_points(coords, radii, indptr, indices, sphere)
+    return accessible * radii * radii * (4 * np.pi / len(sphere))
@@ -1,9 +1,12 @@
+import importlib.util
 import unittest
 from pathlib import Path
+
+import numpy as np
 from Bio.PDB import PDBParser
 
-from src.metrics import Builder
-from src.metrics.metrics import ModStructure, ModRes
+from src.metrics import Builder, batch
+from src.metrics.metrics import GLYXGLY_ASA, ModStructure, ModRes
 
 class BuildingTests(unittest.TestCase):
     def setUp(self):
@@ -16,3 +19,98 @@ class BuildingTests(unittest.TestCase):
             self.assertIsInstance(s, ModStructure)
             for residue in s.get_residues():
                 self.assertIsInstance(residue, ModRes)
+
+
+    @unittest.skipUnless(importlib.util.find_spec("gemmi"), "needs gemmi")
+    def testBuildFromGemmi(self):
+        for pdbfile in self.pdb.iterdir():
+            s = ModStructure.build_from_gemmi(pdbfile)
+            ref = self.parser.get_structure(pdbfile.stem, pdbfile)
+            self.assertIsInstance(s, ModStructure)
+            self.assertEqual(
+                [a.get_full_id() for a in s.get_atoms()],
+                [a.get_full_id() for a in ref.get_atoms()])
+            np.testing.assert_array_equal(s._coords, ref._coords)
+
+
+class MeasureTests(unittest.TestCase):
+    def setUp(self):
+        parser = PDBParser(QUIET=1, structure_builder=Builder())
+        self.s = parser.get_structure("1ris", Path("tests/pdb/1ris.pdb"))
+        self.s.measure()
+
+    def testAminocount(self):
+        seq = self.s.sequence
+        pos, neg, hyd = self.s.aminocount()
+        self.assertEqual(pos, seq.count('K') + seq.count('R'))
+        self.assertEqual(neg, seq.count('D') + seq.count('E'))
+        self.assertEqual(hyd, sum(seq.count(aa) for aa in 'FLIV'))
+        self.assertEqual(self.s.nc, pos - neg)
+
+    def testSasa(self):
+        self.assertAlmostEqual(self.s.sasa, 6223.45, places=2)
+        self.assertAlmostEqual(
+            self.s.sasa,
+            sum(atom.sasa for atom in self.s.get_atoms()))
+        for residue in self.s.get_residues():
+            self.assertGreaterEqual(residue.monosasa, 0)
+
+    def testCenterOfMassFast(self):
+        np.testing.assert_allclose(
+            self.s.center_of_mass_fast(), self.s.center_of_mass(), rtol=1e-5)
+        self.assertEqual(len(self.s._coords), len(list(self.s.get_atoms())))
+
+    def testMolecularWeight(self):
+        from Bio.SeqUtils.ProtParam import ProteinAnalysis
+        self.assertAlmostEqual(
+            self.s.molecularweight(),
+            ProteinAnalysis(self.s.sequence).molecular_weight(),
+            places=6)
+
+    def testIsBuried(self):
+        for residue in self.s.get_residues():
+            ratio = residue.monosasa / GLYXGLY_ASA[residue.resletter]
+            self.assertEqual(residue.is_buried(), ratio <= 0.25)
+
+
+class AngleTests(unittest.TestCase):
+    def testAnglemeasurement(self):
+        v = np.array([1.0, 0.0, 0.0])
+        self.assertAlmostEqual(ModStructure.anglemeasurement(v, v), 0.0)
+        self.assertAlmostEqual(
+            ModStructure.anglemeasurement(v, np.array([0.0, 2.0, 0.0])), 90.0)
+        self.assertAlmostEqual(ModStructure.anglemeasurement(v, -v), 180.0)
+        self.assertAlmostEqual(
+            ModStructure.anglemeasurement(v, np.array([1.0, 1e-9, 0.0])),
+            np.degrees(1e-9))
+
+
+class ResidueArrayTests(unittest.TestCase):
+    def testResidueCenterOfMass(self):
+        parser = PDBParser(QUIET=1, structure_builder=Builder())
+        s = parser.get_structure("1ris", Path("tests/pdb/1ris.pdb"))
+        s.measure()
+        expected = [residue.center_of_mass() for residue in s.get_residues()]
+        np.testing.assert_allclose(s._com, expected, rtol=1e-5)
+
+    def testCachedProperties(self):
+        parser = PDBParser(QUIET=1, structure_builder=Builder())
+        s = parser.get_structure("1ris", Path("tests/pdb/1ris.pdb"))
+        self.assertEqual(s.sequence, s.sequencer())
+        self.assertEqual(s.length, len(s.sequence))
+        self.assertIs(s.aminocount(), s.aminocount())
+        sasa = s.sasa
+        s.clear_cache()
+        self.assertNotIn("sasa", s.__dict__)
+        self.assertAlmostEqual(s.sasa, sasa)
+
+
+class BatchTests(unittest.TestCase):
+    def testRun(self):
+        pdbfiles = sorted(Path("tests/pdb").iterdir())
+        results = list(batch.run(pdbfiles, workers=2))
+        self.assertEqual([r['id'] for r in results], [p.stem for p in pdbfiles])
+        parser = PDBParser(QUIET=1, structure_builder=Builder())
+        s = parser.get_structure(pdbfiles[0].stem, pdbfiles[0])
+        s.measure()
+        self.assertEqual(results[0], s.serializer())